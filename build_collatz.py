@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+"""
+Compile the Collatz kernels ahead of time into the collatz_kernel extension module.
+The range calculators import it when it exists, so they start without waiting for
+Numba to JIT-compile anything. The kernels are the plain Python functions behind
+the JIT versions in collatz_range_v3.py, so both builds always run the same code.
+
+Usage: python build_collatz.py
+"""
+
+from numba.pycc import CC
+
+import collatz_range_v3
+
+cc = CC('collatz_kernel')
+
+# Returns collatz_range_v3.OVERFLOW when the sequence does not fit in a uint64
+cc.export('collatz_steps_u64', 'u4(u8, u2[::1])')(collatz_range_v3.collatz_steps.py_func)
+cc.export('build_lengths', 'void(u2[::1], i8, i8)')(collatz_range_v3.build_lengths.py_func)
+
+if __name__ == "__main__":
+    cc.compile()
@@ -0,0 +1,42 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+
+"""
+C implementation of the Collatz step kernel for machines without Numba.
+Exposes the same collatz_steps_u64 as the collatz_kernel module built by
+build_collatz.py, so the range calculators can use either one.
+
+Build with: cythonize -i collatz_c.pyx
+"""
+
+cdef extern from *:
+    # GCC/Clang builtin: a single tzcnt/bsf instruction
+    int __builtin_ctzll(unsigned long long x) nogil
+
+# Largest odd n for which 3n+1 still fits in 64 bits
+cdef unsigned long long MAX_ODD = (0xFFFFFFFFFFFFFFFF - 1) // 3
+
+# Returned instead of a step count when the sequence leaves the uint64 range
+cdef unsigned int OVERFLOW = 0xFFFFFFFF
+
+cpdef unsigned int collatz_steps_u64(unsigned long long n, const unsigned short[::1] memo) noexcept nogil:
+    """
+    Calculate the number of steps to reach 1 in the Collatz sequence for number n.
+    Stops as soon as it reaches a number below len(memo) whose steps are already
+    known (0 means unknown). Returns OVERFLOW if the sequence does not fit in 64 bits.
+    """
+    cdef unsigned long long size = memo.shape[0]
+    # Divide out every factor of two in one shift; n is odd from here on
+    cdef int tz = __builtin_ctzll(n)
+    cdef unsigned int count = tz
+    n >>= tz
+    while n != 1:
+        if n < size and memo[n] != 0:
+            return count + memo[n]
+        if n > MAX_ODD:
+            return OVERFLOW
+        n = 3 * n + 1
+        # 3n+1 is even: strip all of its trailing zeros at once
+        tz = __builtin_ctzll(n)
+        n >>= tz
+        count += 1 + tz
+    return count
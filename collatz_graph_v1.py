@@ -1,33 +1,191 @@
+import os
+
 import matplotlib.pyplot as plt
+import numpy as np
+from llvmlite import ir
+from numba import cuda, get_num_threads, njit, prange, types, uint32, uint64
+from numba.extending import intrinsic, overload
 from tqdm import tqdm
 
-def collatz_steps(start):
-    number = start
-    count = 0
-    while number != 1:
-        number = number // 2 if number % 2 == 0 else 3 * number + 1
-        count += 1
+# Starting numbers (and their first 3n + 1) stay inside the int64 range scan_range
+# indexes with. Later terms can still outgrow 64 bits; collatz_steps_nb catches those.
+MAX_START = 2**63 // 3
+
+# Typed constants keep Numba from promoting uint64 arithmetic to float64
+ONE = np.uint64(1)
+THREE = np.uint64(3)
+
+# Largest odd n for which 3n+1 still fits in a uint64
+MAX_ODD = np.uint64((2**64 - 2) // 3)
+
+# Returned by collatz_steps_nb instead of a step count when the sequence leaves the uint64 range
+OVERFLOW = 2**32 - 1
+
+THREADS_PER_BLOCK = 256
+
+# Step counts are streamed to this file instead of being held in RAM
+STEPS_FILE = "collatz_steps.bin"
+
+# Plotting every number in a huge range is pointless; keep about this many points
+PLOT_POINTS = 200000
+
+@intrinsic
+def ctz(typingctx, x):
+    # Lowers to a single tzcnt/bsf instruction via LLVM's cttz
+    def codegen(context, builder, signature, args):
+        return builder.cttz(args[0], ir.Constant(ir.IntType(1), 0))
+    return types.int64(x), codegen
+
+def trailing_zeros(x):
+    # Plain Python fallback (the CUDA simulator runs this); compiled code uses the overloads below
+    x = int(x)
+    return (x & -x).bit_length() - 1
+
+@overload(trailing_zeros, target='cpu')
+def trailing_zeros_cpu(x):
+    return lambda x: ctz(x)
+
+@overload(trailing_zeros, target='cuda')
+def trailing_zeros_cuda(x):
+    # ffs is the 1-based index of the lowest set bit, so ffs - 1 counts trailing zeros
+    return lambda x: cuda.ffs(x) - 1
+
+@njit(uint32(uint64), cache=True, fastmath=False)
+def collatz_steps_nb(n):
+    # Strip every factor of two at once; after that n is always odd, so a power
+    # of two 2^k (including any 3n+1 that lands on one) finishes in a single shift
+    tz = trailing_zeros(n)
+    n >>= tz
+    count = tz
+    while n != ONE:
+        if n > MAX_ODD:
+            return OVERFLOW
+        n = THREE * n + ONE
+        tz = trailing_zeros(n)
+        n >>= tz
+        count += 1 + tz
     return count
 
+# The same step function compiled for the GPU, so both paths always agree
+collatz_steps_cuda = cuda.jit(device=True)(collatz_steps_nb.py_func)
+
+def collatz_steps_big(n):
+    # Python ints never overflow; used for the numbers collatz_steps_nb reports as OVERFLOW
+    zeros = (n & -n).bit_length() - 1
+    n >>= zeros
+    count = zeros
+    while n != 1:
+        n = 3 * n + 1
+        zeros = (n & -n).bit_length() - 1
+        n >>= zeros
+        count += 1 + zeros
+    return count
+
+@njit(cache=True)
+def merge_maxima(local_idx, local_max):
+    # Slices are in order, so a strict > keeps the first overall maximum
+    best = 0
+    for c in range(1, len(local_max)):
+        if local_max[c] > local_max[best]:
+            best = c
+    return local_idx[best], local_max[best]
+
+@njit(parallel=True, cache=True)
+def scan_range(start, end, out, chunks):
+    # Each thread fills a contiguous slice and tracks its maximum on the fly
+    count = end - start + 1
+    size = (count + chunks - 1) // chunks
+    local_max = np.zeros(chunks, dtype=np.int64)
+    local_idx = np.zeros(chunks, dtype=np.int64)
+    for c in prange(chunks):
+        best = 0
+        best_i = c * size
+        for i in range(c * size, min((c + 1) * size, count)):
+            steps = collatz_steps_nb(np.uint64(start + i))
+            # Left as 0 (only 1 really takes 0 steps) for the caller to recount with Python ints
+            steps = 0 if steps == OVERFLOW else steps
+            out[i] = steps
+            # Branch-free running maximum: both updates lower to cmov
+            best_i = i if steps > best else best_i
+            best = max(best, steps)
+        local_max[c] = best
+        local_idx[c] = best_i
+    return merge_maxima(local_idx, local_max)
+
+@cuda.jit
+def collatz_kernel(start, out):
+    # One GPU thread per starting number; the number is derived from the thread index
+    i = cuda.grid(1)
+    if i < out.size:
+        steps = collatz_steps_cuda(start + np.uint64(i))
+        # Left as 0 (only 1 really takes 0 steps) for the host to recount with Python ints
+        out[i] = 0 if steps == OVERFLOW else steps
+
+def scan_range_cuda(start, out):
+    d_out = cuda.device_array(len(out), dtype=out.dtype)
+    blocks = (len(out) + THREADS_PER_BLOCK - 1) // THREADS_PER_BLOCK
+    collatz_kernel[blocks, THREADS_PER_BLOCK](np.uint64(start), d_out)
+    d_out.copy_to_host(out)
+
+@njit(parallel=True, cache=True)
+def find_max(steps, chunks):
+    # Each thread keeps its own max over a contiguous slice, then the slices are merged
+    size = (len(steps) + chunks - 1) // chunks
+    local_max = np.zeros(chunks, dtype=np.int64)
+    local_idx = np.zeros(chunks, dtype=np.int64)
+    for c in prange(chunks):
+        best = 0
+        best_i = c * size
+        for i in range(c * size, min((c + 1) * size, len(steps))):
+            best_i = i if steps[i] > best else best_i
+            best = max(best, steps[i])
+        local_max[c] = best
+        local_idx[c] = best_i
+    return merge_maxima(local_idx, local_max)
+
 def plot_steps_summary(start=1, end=500000):
-    numbers = list(range(start, end + 1))
+    if start < 1 or end < start:
+        raise ValueError("Start must be >= 1 and end must not be less than start.")
+    if end >= MAX_START:
+        raise ValueError(f"End must be less than {MAX_START:,} to fit in int64.")
+
+    total = end - start + 1
     
     print(f"Calculating Collatz steps for numbers {start:,} to {end:,}...")
-    steps_required = []
-    max_steps = 0
-    number_with_max_steps = start
+    # Two bytes per number, backed by disk so ranges larger than RAM still fit
+    steps_required = np.memmap(STEPS_FILE, dtype=np.uint16, mode='w+', shape=(total,))
 
-    for n in tqdm(numbers):
-        steps = collatz_steps(n)
-        steps_required.append(steps)
+    # Scan in blocks so the progress bar moves while every core (or the GPU) works on each block
+    use_gpu = cuda.is_available()
+    blocks = (os.cpu_count() or 1) * 4
+    block_size = -(-total // blocks)
+    max_index, max_steps = 0, 0
+    with tqdm(total=total) as pbar:
+        for lo in range(0, total, block_size):
+            hi = min(lo + block_size, total)
+            if use_gpu:
+                scan_range_cuda(start + lo, steps_required[lo:hi])
+            else:
+                index, block_max = scan_range(start + lo, start + hi - 1, steps_required[lo:hi], get_num_threads())
+                if block_max > max_steps:
+                    max_index, max_steps = lo + index, block_max
+            # Numbers whose sequence outgrew 64 bits came back as 0
+            for i in np.flatnonzero(steps_required[lo:hi] == 0) + lo:
+                if start + i > 1:
+                    steps_required[i] = collatz_steps_big(start + int(i))
+                    if steps_required[i] > max_steps or (steps_required[i] == max_steps and i < max_index):
+                        max_index, max_steps = i, steps_required[i]
+            pbar.update(hi - lo)
 
-        if steps > max_steps:
-            max_steps = steps
-            number_with_max_steps = n
+    if use_gpu:
+        max_index, max_steps = find_max(steps_required, get_num_threads())
+    number_with_max_steps = start + int(max_index)
+    steps_required.flush()
 
-    # Plot
+    # Plot every stride-th number only
+    stride = max(1, total // PLOT_POINTS)
     plt.figure(figsize=(14, 6))
-    plt.plot(numbers, steps_required, linewidth=0.5, color='blue')
+    plt.plot(np.arange(start, end + 1, stride), steps_required[::stride], linewidth=0.5, color='blue')
     plt.title(f'3x + 1: Steps to Reach 1 (From {start:,} to {end:,})', fontsize=14)
     plt.xlabel('Starting Number')
     plt.ylabel('Steps to Reach 1')
@@ -38,6 +196,7 @@ def plot_steps_summary(start=1, end=500000):
     # Output max info
     print(f"\n🔥 Number with the most steps: {number_with_max_steps:,}")
     print(f"📈 Maximum steps to reach 1: {max_steps}")
+    print(f"💾 Step counts for every number saved to {STEPS_FILE}")
 
 def main():
     plot_steps_summary(1, 500000)
@@ -1,27 +1,41 @@
 import time
 
-collatz_lengths_cache = {1: 1}
+import numpy as np
 
-def get_collatz_sequence_length(n):
+def new_lengths_cache(limit):
+    # Dense cache for 1..limit-1, 0 means "not computed yet". Lengths stay far
+    # below 2**16, so two bytes per entry is enough.
+    cache = np.zeros(limit, dtype=np.uint16)
+    cache[1] = 1
+    # Index through a memoryview: it yields plain ints and is faster than numpy scalars
+    return cache.data
+
+def get_collatz_sequence_length(n, collatz_lengths_cache):
     if n <= 0:
         raise ValueError("Input must be a positive integer.")
-    if n in collatz_lengths_cache:
+    limit = len(collatz_lengths_cache)
+    if n < limit and collatz_lengths_cache[n]:
         return collatz_lengths_cache[n]
     
     stack = []
     current = n
-    while current not in collatz_lengths_cache:
-        stack.append(current)
-        if current % 2 == 0:
-            current = current // 2
+    while current >= limit or not collatz_lengths_cache[current]:
+        if current % 2 == 1:
+            following, hops = 3 * current + 1, 1
         else:
-            current = 3 * current + 1
+            following, hops = current, 0
+        # Divide out every factor of two at once; (x & -x) isolates the lowest set bit
+        zeros = (following & -following).bit_length() - 1
+        stack.append((current, hops + zeros))
+        current = following >> zeros
     
     length = collatz_lengths_cache[current]
     while stack:
-        current = stack.pop()
-        length += 1
-        collatz_lengths_cache[current] = length
+        current, hops = stack.pop()
+        length += hops
+        # Only numbers inside the dense cache are remembered
+        if current < limit:
+            collatz_lengths_cache[current] = length
     
     return length
 
@@ -29,11 +43,12 @@ def find_longest_collatz_under_limit(limit):
     if limit < 2:
         raise ValueError("Limit must be at least 2.")
     
+    collatz_lengths_cache = new_lengths_cache(limit)
     max_len = 0
     start_num = 0
     
     for i in range(1, limit):
-        current_len = get_collatz_sequence_length(i)
+        current_len = get_collatz_sequence_length(i, collatz_lengths_cache)
         if current_len > max_len:
             max_len = current_len
             start_num = i
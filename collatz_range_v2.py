@@ -3,6 +3,9 @@ from tqdm import tqdm
 
 collatz_lengths_cache = {1: 1}
 
+# Numbers handled between progress bar updates; per-number updates cost as much as the math
+PROGRESS_CHUNK = 1_000_000
+
 def get_collatz_sequence_length(n):
     if n <= 0:
         raise ValueError("Input must be a positive integer.")
@@ -12,16 +15,19 @@ def get_collatz_sequence_length(n):
     stack = []
     current = n
     while current not in collatz_lengths_cache:
-        stack.append(current)
-        if current % 2 == 0:
-            current = current // 2
+        if current % 2 == 1:
+            following, hops = 3 * current + 1, 1
         else:
-            current = 3 * current + 1
+            following, hops = current, 0
+        # Divide out every factor of two at once; (x & -x) isolates the lowest set bit
+        zeros = (following & -following).bit_length() - 1
+        stack.append((current, hops + zeros))
+        current = following >> zeros
     
     length = collatz_lengths_cache[current]
     while stack:
-        current = stack.pop()
-        length += 1
+        current, hops = stack.pop()
+        length += hops
         collatz_lengths_cache[current] = length
     
     return length
@@ -33,11 +39,15 @@ def find_longest_collatz_in_range(start, end):
     max_len = 0
     start_num = 0
 
-    for i in tqdm(range(start, end), desc=f"Checking {start}-{end}", unit="num"):
-        current_len = get_collatz_sequence_length(i)
-        if current_len > max_len:
-            max_len = current_len
-            start_num = i
+    with tqdm(total=end - start, desc=f"Checking {start}-{end}", unit="num") as pbar:
+        for base in range(start, end, PROGRESS_CHUNK):
+            stop = min(base + PROGRESS_CHUNK, end)
+            for i in range(base, stop):
+                current_len = get_collatz_sequence_length(i)
+                if current_len > max_len:
+                    max_len = current_len
+                    start_num = i
+            pbar.update(stop - base)
 
     return start_num, max_len
 
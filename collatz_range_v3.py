@@ -1,56 +1,230 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import time
-from typing import Dict, Tuple
+from typing import Tuple
 from array import array
+import numpy as np
+from llvmlite import ir
+from numba import get_num_threads, njit, prange, types, uint16, uint32, uint64
+from numba.extending import intrinsic
 from tqdm import tqdm
 
-def collatz_steps(n: int, memo: Dict[int, int] = None) -> int:
+# Starting numbers (and their first 3n + 1) stay inside the int64 range scan_range
+# indexes with. This does not keep later terms small: collatz_steps catches those.
+MAX_START = 2**63 // 3
+
+# Numbers below this are memoized (2 bytes each, so at most 2 GiB)
+MEMO_LIMIT = 2**30
+
+# Typed constants keep Numba from promoting uint64 arithmetic to float64
+ONE = np.uint64(1)
+THREE = np.uint64(3)
+
+# Largest odd n for which 3n+1 still fits in a uint64
+MAX_ODD = np.uint64((2**64 - 2) // 3)
+
+# Returned by collatz_steps instead of a step count when the sequence leaves the uint64 range
+OVERFLOW = 2**32 - 1
+
+@intrinsic
+def ctz(typingctx, x):
+    """Count the trailing zero bits of x using LLVM's cttz (a single tzcnt/bsf)."""
+    def codegen(context, builder, signature, args):
+        return builder.cttz(args[0], ir.Constant(ir.IntType(1), 0))
+    return types.int64(x), codegen
+
+@njit(uint32(uint64, uint16[::1]), cache=True)
+def collatz_steps(n, memo):
     """
     Calculate the number of steps to reach 1 in the Collatz sequence for number n.
-    Uses memoization to avoid recalculating sequences.
+    Compiled to native uint64 arithmetic by Numba. Stops as soon as it reaches a
+    number below len(memo) whose steps are already known (0 means unknown).
+    Returns OVERFLOW if the sequence does not fit in a uint64.
     """
-    if memo is None:
-        memo = {}
-    
-    # Return from memo if already calculated
-    if n in memo:
-        return memo[n]
-    
-    # Base case
-    if n == 1:
-        return 0
-    
-    # Use bitwise operations for odd/even check and calculations
-    if n & 1 == 0:  # Even number
-        steps = 1 + collatz_steps(n >> 1, memo)  # n/2 using right shift
-    else:  # Odd number
-        # For very large numbers, use intermediate calculation to avoid overflow
-        next_n = ((n << 1) + n + 1)  # 3n+1 using left shift
-        steps = 1 + collatz_steps(next_n, memo)
-    
-    # Store result in memo
-    memo[n] = steps
-    return steps
+    size = np.uint64(len(memo))
+    # Divide out every factor of two in one shift; n is odd from here on
+    tz = ctz(n)
+    n >>= tz
+    count = tz
+    while n != ONE:
+        if n < size and memo[n] != 0:
+            return count + memo[n]
+        if n > MAX_ODD:
+            return OVERFLOW
+        n = THREE * n + ONE
+        # 3n+1 is even: strip all of its trailing zeros at once
+        tz = ctz(n)
+        n >>= tz
+        count += 1 + tz
+    return count
 
-def find_max_steps_in_range(start: int, end: int) -> Tuple[int, int, Dict[int, int]]:
+@njit(cache=True)
+def build_lengths(memo: np.ndarray, lo: int, hi: int) -> None:
+    """
+    Fill memo[i] for lo <= i < hi bottom-up, given that every entry below lo is filled.
+    An even i is one step from i/2. An odd i is only followed until it drops below
+    itself, so no trajectory is walked further than the first known number.
+    """
+    for i in range(max(lo, 2), hi):
+        if i & 1 == 0:
+            memo[i] = memo[i >> 1] + 1
+        else:
+            n = np.uint64(i)
+            below = n
+            count = 0
+            while n >= below:
+                n = THREE * n + ONE
+                tz = ctz(n)
+                n >>= tz
+                count += 1 + tz
+            memo[i] = count + memo[n]
+
+try:
+    # build_collatz.py compiles this same build_lengths ahead of time, so it needs no JIT warmup
+    from collatz_kernel import build_lengths as sieve
+except ImportError:
+    sieve = build_lengths
+
+@njit(cache=True)
+def merge_maxima(local_idx: np.ndarray, local_max: np.ndarray) -> Tuple[int, int]:
+    """Merge per-thread maxima of consecutive slices, keeping the first overall maximum."""
+    best = 0
+    for c in range(1, len(local_max)):
+        if local_max[c] > local_max[best]:
+            best = c
+    return local_idx[best], local_max[best]
+
+@njit(parallel=True, cache=True)
+def scan_range(start: int, end: int, out: np.ndarray, memo: np.ndarray, chunks: int) -> Tuple[int, int]:
+    """
+    Fill out[i] with the step count of start + i, spread across all cores, and
+    return the index and value of the first maximum. Each thread keeps a running
+    maximum over its own slice while it computes it, so no second pass is needed.
+    Every result that fits in memo is also stored there for later lookups. All
+    threads share memo without locks: a number's step count is the same whichever
+    thread stores it, so racing writes always agree.
+    """
+    count = end - start + 1
+    size = (count + chunks - 1) // chunks
+    local_max = np.zeros(chunks, dtype=np.int64)
+    local_idx = np.zeros(chunks, dtype=np.int64)
+    for c in prange(chunks):
+        best = 0
+        best_i = c * size
+        for i in range(c * size, min((c + 1) * size, count)):
+            n = start + i
+            steps = collatz_steps(np.uint64(n), memo)
+            if steps == OVERFLOW:
+                # Left as 0 (only 1 really takes 0 steps) for the caller to redo with Python ints
+                steps = 0
+            elif n < len(memo):
+                memo[n] = steps
+            out[i] = steps
+            # Branch-free running maximum: both updates lower to cmov instead of a jump
+            best_i = i if steps > best else best_i
+            best = max(best, steps)
+        local_max[c] = best
+        local_idx[c] = best_i
+    return merge_maxima(local_idx, local_max)
+
+@njit(parallel=True, cache=True)
+def find_max(steps: np.ndarray, chunks: int) -> Tuple[int, int]:
+    """
+    Return the index and value of the first maximum in steps.
+    Each thread reduces its own slice before the per-thread maxima are merged.
+    """
+    size = (len(steps) + chunks - 1) // chunks
+    local_max = np.zeros(chunks, dtype=np.int64)
+    local_idx = np.zeros(chunks, dtype=np.int64)
+    for c in prange(chunks):
+        best = 0
+        best_i = c * size
+        for i in range(c * size, min((c + 1) * size, len(steps))):
+            best_i = i if steps[i] > best else best_i
+            best = max(best, steps[i])
+        local_max[c] = best
+        local_idx[c] = best_i
+    return merge_maxima(local_idx, local_max)
+
+def collatz_steps_big(n: int) -> int:
+    """
+    Calculate the number of steps to reach 1 in the Collatz sequence for number n
+    with Python ints, for the sequences collatz_steps reports as OVERFLOW.
+    """
+    # (x & -x) isolates the lowest set bit, so this strips every factor of two at once
+    zeros = (n & -n).bit_length() - 1
+    n >>= zeros
+    count = zeros
+    while n != 1:
+        n = 3 * n + 1
+        zeros = (n & -n).bit_length() - 1
+        n >>= zeros
+        count += 1 + zeros
+    return count
+
+def get_collatz_sequence(n: int, steps: int) -> np.ndarray:
+    """
+    Generate the full Collatz sequence for a number that takes steps steps to reach 1.
+    The length is known up front, so the terms go straight into a preallocated uint64
+    array; it only switches to Python ints if a term outgrows 64 bits.
+    """
+    sequence = np.empty(steps + 1, dtype=np.uint64)
+    for i in range(steps + 1):
+        try:
+            sequence[i] = n
+        except OverflowError:
+            sequence = sequence.astype(object)
+            sequence[i] = n
+        if n & 1 == 0:
+            n = n >> 1
+        else:
+            n = 3 * n + 1
+    return sequence
+
+def find_max_steps_in_range(start: int, end: int) -> Tuple[int, int, np.ndarray]:
     """
     Find the number with the maximum number of steps in the Collatz sequence
     within the given range. Shows progress with tqdm.
+    Returns max_num, max_steps and the step count of every number in the range.
     """
-    max_steps = 0
-    max_num = start
-    memo = {}  # Memoization dictionary to avoid recalculations
+    # Dense memo indexed by the number itself; uint16 holds any step count we can reach
+    memo = np.zeros(min(end + 1, MEMO_LIMIT), dtype=np.uint16)
+    blocks = (os.cpu_count() or 1) * 4
     
-    # Use tqdm for progress bar
-    for n in tqdm(range(start, end + 1), desc="Calculating", unit="numbers"):
-        steps = collatz_steps(n, memo)
-        if steps > max_steps:
-            max_steps = steps
-            max_num = n
-            
-    return max_num, max_steps, memo
+    if end < MEMO_LIMIT and 2 * start <= end:
+        # The range covers most of [1, end], so sieve every length up to end bottom-up.
+        # Each block only needs the blocks before it, so progress is reported per block.
+        block_size = -(-end // blocks)
+        with tqdm(total=end, desc="Calculating", unit="numbers") as pbar:
+            for lo in range(1, end + 1, block_size):
+                hi = min(lo + block_size, end + 1)
+                sieve(memo, lo, hi)
+                pbar.update(hi - lo)
+        steps = memo[start:]
+        max_index, max_steps = find_max(steps, get_num_threads())
+    else:
+        steps = np.empty(end - start + 1, dtype=np.uint16)
+        
+        # Scan in blocks so the progress bar moves while every core works on each block
+        max_index, max_steps = 0, 0
+        block_size = -(-len(steps) // blocks)
+        with tqdm(total=len(steps), desc="Calculating", unit="numbers") as pbar:
+            for lo in range(0, len(steps), block_size):
+                hi = min(lo + block_size, len(steps))
+                index, block_max = scan_range(start + lo, start + hi - 1, steps[lo:hi], memo, get_num_threads())
+                if block_max > max_steps:
+                    max_index, max_steps = lo + index, block_max
+                # Numbers whose sequence outgrew 64 bits came back as 0
+                for i in np.flatnonzero(steps[lo:hi] == 0) + lo:
+                    if start + i > 1:
+                        steps[i] = collatz_steps_big(start + int(i))
+                        if steps[i] > max_steps or (steps[i] == max_steps and i < max_index):
+                            max_index, max_steps = i, steps[i]
+                pbar.update(hi - lo)
+    
+    return start + int(max_index), int(max_steps), steps
 
 def main():
     try:
@@ -67,11 +241,15 @@ def main():
             print("Starting number must be less than or equal to ending number.")
             return
         
+        if end >= MAX_START:
+            print(f"Ending number must be less than {MAX_START} to avoid overflow.")
+            return
+        
         # Start timing
         start_time = time.time()
         
         # Run calculation with progress bar
-        max_num, max_steps, memo = find_max_steps_in_range(start, end)
+        max_num, max_steps, steps = find_max_steps_in_range(start, end)
         
         # Calculate elapsed time
         elapsed_time = time.time() - start_time
@@ -93,19 +271,15 @@ def main():
         print(f"The number with the maximum steps is: {max_num}")
         print(f"Number of steps: {max_steps}")
         print(f"Calculation completed in: {time_str}")
-        print(f"Cached results: {len(memo)} numbers")
+        print(f"Numbers checked: {len(steps)}")
+        
+        # The sequence is only built if it is asked for, and at most once
+        sequence = None
         
         # Show the sequence for the max number
         show_sequence = input("\nWould you like to see the sequence for the maximum steps number? (y/n): ")
         if show_sequence.lower() == 'y':
-            n = max_num
-            sequence = [n]
-            while n != 1:
-                if n & 1 == 0:
-                    n = n >> 1
-                else:
-                    n = 3 * n + 1
-                sequence.append(n)
+            sequence = get_collatz_sequence(max_num, max_steps)
             
             # Format sequence nicely
             if len(sequence) > 20:
@@ -127,25 +301,18 @@ def main():
                 f.write(f"The number with the maximum steps is: {max_num}\n")
                 f.write(f"Number of steps: {max_steps}\n")
                 f.write(f"Calculation completed in: {time_str}\n")
-                f.write(f"Cached results: {len(memo)} numbers\n")
+                f.write(f"Numbers checked: {len(steps)}\n")
                 
                 # Save sequence for the maximum steps number
                 f.write(f"\nSequence for {max_num}:\n")
-                n = max_num
-                sequence = [n]
-                while n != 1:
-                    if n & 1 == 0:
-                        n = n >> 1
-                    else:
-                        n = 3 * n + 1
-                    sequence.append(n)
+                if sequence is None:
+                    sequence = get_collatz_sequence(max_num, max_steps)
                 f.write(" → ".join(map(str, sequence)))
                 
                 # Optionally save full data for all numbers in range
                 f.write(f"\n\nDetailed results for all numbers in range:\n")
                 for i in range(start, end + 1):
-                    if i in memo:
-                        f.write(f"{i}: {memo[i]} steps\n")
+                    f.write(f"{i}: {steps[i - start]} steps\n")
             
             print(f"Results saved to {filename}")
     
@@ -3,90 +3,197 @@
 import sys
 import time
 import os
-import pickle
-from typing import Dict, Tuple
+from multiprocessing import Pool
+from typing import Optional, Tuple
 from array import array
+import numpy as np
 from tqdm import tqdm
 
-# File to store memoization dictionary
-MEMO_FILE = "collatz_memo.pkl"
+try:
+    # Ahead-of-time compiled by build_collatz.py
+    from collatz_kernel import collatz_steps_u64
+except ImportError:
+    try:
+        # Cython build of collatz_c.pyx, for machines without Numba
+        from collatz_c import collatz_steps_u64
+    except ImportError:
+        # Every number is calculated by the pure-Python collatz_steps below
+        collatz_steps_u64 = None
 
-def load_memo() -> Dict[int, int]:
-    """Load memoization dictionary from file if it exists."""
-    if os.path.exists(MEMO_FILE):
-        try:
-            with open(MEMO_FILE, 'rb') as f:
-                memo = pickle.load(f)
-            print(f"Loaded {len(memo)} pre-calculated results from storage.")
-            return memo
-        except Exception as e:
-            print(f"Error loading memoization data: {e}")
-            return {}
-    return {}
-
-def save_memo(memo: Dict[int, int]) -> None:
-    """Save memoization dictionary to file."""
+# Step count returned by collatz_steps_u64 when a sequence leaves the uint64 range
+OVERFLOW = 2**32 - 1
+
+# File holding the memoization array, memory-mapped so the OS pages it in and out
+MEMO_FILE = "collatz_memo.dat"
+
+# Numbers below this are memoized, 2 bytes each. The file only grows as far as the
+# largest range asked for so far, so this caps it at 8 GiB.
+MEMO_LIMIT = 2**32
+
+# Numbers handled between progress bar updates; per-number updates cost as much as the math
+PROGRESS_CHUNK = 1_000_000
+
+# Each worker process's view of the memo file, set up by init_worker
+worker_memo = None
+
+def load_memo(size: int) -> np.ndarray:
+    """
+    Open the memoization file with room for every number below size (at most
+    MEMO_LIMIT), creating it or growing it if it is smaller than that.
+    Every result written to the returned array goes straight to the file;
+    the OS decides which parts stay in RAM, so no explicit save step is needed.
+    """
+    size = min(size, MEMO_LIMIT)
     try:
-        with open(MEMO_FILE, 'wb') as f:
-            pickle.dump(memo, f)
-        print(f"Saved {len(memo)} calculated results to storage for future use.")
+        if os.path.exists(MEMO_FILE):
+            print(f"Using pre-calculated results from {MEMO_FILE}.")
+            size = max(size, os.path.getsize(MEMO_FILE) // 2)
+        with open(MEMO_FILE, 'ab') as f:
+            # Reserve the disk space now: running out of it later, while writing
+            # through the map, would kill the process with SIGBUS instead of raising
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, 2 * size)
+            else:
+                f.truncate(2 * size)
+        return np.memmap(MEMO_FILE, dtype=np.uint16, mode='r+')
     except Exception as e:
-        print(f"Error saving memoization data: {e}")
+        print(f"Error opening memoization file, results will not be kept: {e}")
+        return np.zeros(0, dtype=np.uint16)
 
-def collatz_steps(n: int, memo: Dict[int, int]) -> int:
+def save_memo(memo: np.ndarray) -> None:
+    """Flush results still held in RAM to the memoization file."""
+    if isinstance(memo, np.memmap):
+        memo.flush()
+
+def collatz_steps(n: int, memo: memoryview) -> int:
     """
     Calculate the number of steps to reach 1 in the Collatz sequence for number n.
-    Uses memoization to avoid recalculating sequences.
+    Uses memoization to avoid recalculating sequences: memo is a writable uint16
+    view indexed by number, where 0 means the number has not been calculated yet.
+    Walks the sequence with an explicit stack, so long trajectories never hit
+    Python's recursion limit.
     """
-    # Return from memo if already calculated
-    if n in memo:
-        return memo[n]
+    limit = len(memo)
+    stack = []
+    current = n
     
-    # Base case
-    if n == 1:
-        return 0
+    # Walk forward until we reach 1 or a number that is already in the memo
+    while current != 1 and (current >= limit or not memo[current]):
+        # Use bitwise operations for odd/even check and calculations
+        if current & 1 == 0:  # Even number
+            next_n, hops = current, 0
+        else:  # Odd number
+            next_n, hops = ((current << 1) + current + 1), 1  # 3n+1 using left shift
+        
+        # Divide out every factor of two in one shift; (x & -x) isolates the lowest set bit
+        zeros = (next_n & -next_n).bit_length() - 1
+        stack.append((current, hops + zeros))
+        current = next_n >> zeros
     
-    # Use bitwise operations for odd/even check and calculations
-    if n & 1 == 0:  # Even number
-        steps = 1 + collatz_steps(n >> 1, memo)  # n/2 using right shift
-    else:  # Odd number
-        # For very large numbers, use intermediate calculation to avoid overflow
-        next_n = ((n << 1) + n + 1)  # 3n+1 using left shift
-        steps = 1 + collatz_steps(next_n, memo)
+    # Base case: 1 takes no steps
+    steps = memo[current] if current < limit else 0
     
-    # Store result in memo
-    memo[n] = steps
+    # Unwind the stack, storing every number we passed through that fits in the memo
+    while stack:
+        current, hops = stack.pop()
+        steps += hops
+        if current < limit:
+            memo[current] = steps
     return steps
 
-def find_max_steps_in_range(start: int, end: int, memo: Dict[int, int]) -> Tuple[int, int, int, int]:
+def scan_numbers(lo: int, hi: int, memo: np.ndarray) -> Tuple[int, int]:
+    """
+    Calculate the steps for every number in [lo, hi), filling memo along the way.
+    Returns the first number with the most steps and its step count.
+    """
+    max_steps = 0
+    max_num = lo
+    # Index through a memoryview: it yields plain ints and is faster than numpy scalars
+    memo_view = memo.data
+    for n in range(lo, hi):
+        steps = OVERFLOW
+        if collatz_steps_u64 is not None and n < 2**64:
+            steps = collatz_steps_u64(n, memo)
+        if steps == OVERFLOW:
+            # No compiled kernel, or the sequence needs more than 64 bits
+            steps = collatz_steps(n, memo_view)
+        elif n < len(memo_view):
+            memo_view[n] = steps
+        if steps > max_steps:
+            max_steps = steps
+            max_num = n
+    return max_num, max_steps
+
+def init_worker(memo_file: str) -> None:
+    """Map the memoization file into a worker process."""
+    global worker_memo
+    worker_memo = np.memmap(memo_file, dtype=np.uint16, mode='r+')
+
+def scan_chunk(bounds: Tuple[int, int]) -> Tuple[int, int]:
+    """Run scan_numbers in a worker process against the shared memo."""
+    return scan_numbers(bounds[0], bounds[1], worker_memo)
+
+def find_max_steps_in_range(start: int, end: int, memo: np.ndarray,
+                            processes: Optional[int] = None) -> Tuple[int, int, int]:
     """
     Find the number with the maximum number of steps in the Collatz sequence
     within the given range. Shows progress with tqdm.
-    Returns max_num, max_steps, new_calculations, total_cached
+    With more than one process, chunks of the range run in parallel, each process
+    mapping the same memo file. Workers write to it without locks: a number's
+    step count is the same whichever worker stores it, so racing writes agree.
+    Returns max_num, max_steps, new_calculations
     """
+    if processes is None:
+        processes = os.cpu_count() or 1
     max_steps = 0
     max_num = start
-    initial_memo_size = len(memo)
     
-    # Use tqdm for progress bar
-    for n in tqdm(range(start, end + 1), desc="Calculating", unit="numbers"):
-        steps = collatz_steps(n, memo)
-        if steps > max_steps:
-            max_steps = steps
-            max_num = n
+    # Numbers in the range whose steps were not known before this run. 1 is skipped:
+    # it takes 0 steps, which the memo cannot tell apart from unknown.
+    total = end - start + 1
+    counted = max(start, 2)
+    new_calculations = (end + 1 - counted) - int(np.count_nonzero(memo[counted:end + 1]))
     
-    new_calculations = len(memo) - initial_memo_size
-    return max_num, max_steps, new_calculations, len(memo)
+    # Small enough chunks that every process gets work, but never more than PROGRESS_CHUNK
+    chunk_size = max(1, min(PROGRESS_CHUNK, -(-total // (processes * 4))))
+    chunks = [(lo, min(lo + chunk_size, end + 1)) for lo in range(start, end + 1, chunk_size)]
+    
+    # Use tqdm for progress bar, updated once per chunk
+    with tqdm(total=total, desc="Calculating", unit="numbers") as pbar:
+        # Starting worker processes only pays off for large ranges
+        if processes == 1 or total < PROGRESS_CHUNK or not isinstance(memo, np.memmap):
+            for lo, hi in chunks:
+                chunk_num, chunk_steps = scan_numbers(lo, hi, memo)
+                if chunk_steps > max_steps:
+                    max_num, max_steps = chunk_num, chunk_steps
+                pbar.update(hi - lo)
+        else:
+            with Pool(processes, initializer=init_worker, initargs=(memo.filename,)) as pool:
+                # imap keeps chunk order, so ties still go to the smallest number
+                for (lo, hi), (chunk_num, chunk_steps) in zip(chunks, pool.imap(scan_chunk, chunks)):
+                    if chunk_steps > max_steps:
+                        max_num, max_steps = chunk_num, chunk_steps
+                    pbar.update(hi - lo)
+    
+    return max_num, max_steps, new_calculations
 
-def get_collatz_sequence(n: int) -> list:
-    """Generate the full Collatz sequence for a number."""
-    sequence = [n]
-    while n != 1:
+def get_collatz_sequence(n: int, steps: int) -> np.ndarray:
+    """
+    Generate the full Collatz sequence for a number that takes steps steps to reach 1.
+    The length is known up front, so the terms go straight into a preallocated uint64
+    array; it only switches to Python ints if a term outgrows 64 bits.
+    """
+    sequence = np.empty(steps + 1, dtype=np.uint64)
+    for i in range(steps + 1):
+        try:
+            sequence[i] = n
+        except OverflowError:
+            sequence = sequence.astype(object)
+            sequence[i] = n
         if n & 1 == 0:
             n = n >> 1
         else:
             n = 3 * n + 1
-        sequence.append(n)
     return sequence
 
 def format_time(seconds: float) -> str:
@@ -104,13 +211,11 @@ def format_time(seconds: float) -> str:
         return f"{hours} hours, {minutes} minutes and {secs} seconds"
 
 def main():
+    memo = None
     try:
         print("Collatz Conjecture - Maximum Steps Calculator")
         print("--------------------------------------------")
         
-        # Load existing memoization data
-        memo = load_memo()
-        
         start = int(input("Enter the starting number: "))
         end = int(input("Enter the ending number: "))
         
@@ -122,11 +227,15 @@ def main():
             print("Starting number must be less than or equal to ending number.")
             return
         
+        # Load existing memoization data, with room for every number in the range
+        memo = load_memo(end + 1)
+        
         # Start timing
         start_time = time.time()
         
         # Run calculation with progress bar
-        max_num, max_steps, new_calculations, total_cached = find_max_steps_in_range(start, end, memo)
+        max_num, max_steps, new_calculations = find_max_steps_in_range(start, end, memo)
+        save_memo(memo)
         
         # Calculate elapsed time
         elapsed_time = time.time() - start_time
@@ -137,17 +246,15 @@ def main():
         print(f"Number of steps: {max_steps}")
         print(f"Calculation completed in: {time_str}")
         print(f"New calculations: {new_calculations}")
-        print(f"Total cached results: {total_cached}")
+        print(f"Calculated results are kept in {MEMO_FILE} for future use.")
         
-        # Ask if user wants to save the updated memoization data
-        save_option = input("\nWould you like to save calculated results for future use? (y/n): ")
-        if save_option.lower() == 'y':
-            save_memo(memo)
+        # The sequence is only built if it is asked for, and at most once
+        sequence = None
         
         # Show the sequence for the max number
         show_sequence = input("\nWould you like to see the sequence for the maximum steps number? (y/n): ")
         if show_sequence.lower() == 'y':
-            sequence = get_collatz_sequence(max_num)
+            sequence = get_collatz_sequence(max_num, max_steps)
             
             # Format sequence nicely
             if len(sequence) > 20:
@@ -170,11 +277,11 @@ def main():
                 f.write(f"Number of steps: {max_steps}\n")
                 f.write(f"Calculation completed in: {time_str}\n")
                 f.write(f"New calculations: {new_calculations}\n")
-                f.write(f"Total cached results: {total_cached}\n")
                 
                 # Save sequence for the maximum steps number
                 f.write(f"\nSequence for {max_num}:\n")
-                sequence = get_collatz_sequence(max_num)
+                if sequence is None:
+                    sequence = get_collatz_sequence(max_num, max_steps)
                 f.write(" → ".join(map(str, sequence)))
                 
                 # Optionally save full data for numbers in range
@@ -182,7 +289,7 @@ def main():
                 if save_all.lower() == 'y':
                     f.write(f"\n\nDetailed results for all numbers in range:\n")
                     for i in range(start, end + 1):
-                        if i in memo:
+                        if i < len(memo):
                             f.write(f"{i}: {memo[i]} steps\n")
             
             print(f"Results saved to {filename}")
@@ -191,10 +298,8 @@ def main():
         print("Please enter valid integers.")
     except KeyboardInterrupt:
         print("\nCalculation interrupted.")
-        # Save memo on interrupt
-        save_on_exit = input("Would you like to save calculated results before exiting? (y/n): ")
-        if save_on_exit.lower() == 'y':
-            save_memo(memo)
+        # Keep everything calculated so far
+        save_memo(memo)
     except Exception as e:
         print(f"An error occurred: {e}")
 